@@ -3,9 +3,11 @@ Fast packer and unpacker -- makes packing and unpacking with the struct module m
 """
 
 from enum import Enum
-import re
+import array
+import collections
+import contextlib
 import struct
-import inspect
+import sys
 
 __all__ = ["Endianness", "funpack", "fpack"]
 
@@ -21,6 +23,62 @@ class Endianness(Enum):
 	Big = '>'
 	Network = '!'
 
+# Endianness values by character and by case-insensitive name
+_ENDIANS = {
+	Endianness.Native.value:		Endianness.Native,
+	Endianness.NativeNoAlign.value:	Endianness.NativeNoAlign,
+	Endianness.Little.value:		Endianness.Little,
+	Endianness.Big.value:			Endianness.Big,
+	Endianness.Network.value:		Endianness.Network,
+
+	'native':						Endianness.Native,
+	'nativenoalign':				Endianness.NativeNoAlign,
+	'little':						Endianness.Little,
+	'big':							Endianness.Big,
+	'net':							Endianness.Network,
+	'network':						Endianness.Network,
+}
+
+# Compiled structs keyed by endian character and then format string (without the endian character)
+_STRUCTS = {e.value: {} for e in Endianness}
+
+def _compile(e, fmt):
+	"""
+	Compiles format string @fmt for endian character @e and caches it in _STRUCTS.
+	Callers look in _STRUCTS first and only call this on a miss, so a format string is parsed only once.
+	The cache is emptied when it fills up to bound memory for callers that use many distinct formats.
+	"""
+	cache = _STRUCTS[e]
+	if len(cache) >= 512:
+		cache.clear()
+
+	s = cache[fmt] = struct.Struct(e + fmt)
+	return s
+
+# Standard sizes in bytes of the format characters used by the shortcut functions
+_SIZES = {'B': 1, 'b': 1, 'H': 2, 'h': 2, 'I': 4, 'i': 4, 'Q': 8, 'q': 8, 'f': 4, 'd': 8}
+
+# Single-value structs for the shortcut functions, keyed by endian character and then format character
+_SCALARS = {e.value: {c: struct.Struct(e.value + c) for c in 'BbHhIiQqfd'} for e in Endianness}
+
+# array.array typecodes with the same item size as each struct format character
+_ARRAY_CODES = {}
+for _c,_cands in (('B','B'), ('b','b'), ('H','H'), ('h','h'), ('I','IL'), ('i','il'), ('Q','QL'), ('q','ql'), ('f','f'), ('d','d')):
+	_ARRAY_CODES[_c] = [_ for _ in _cands if array.array(_).itemsize == _SIZES[_c]][0]
+del _c, _cands
+
+# Whether data in each endianness has to be byte swapped to match the host
+_NEEDS_SWAP = {
+	Endianness.Native.value: False,
+	Endianness.NativeNoAlign.value: False,
+	Endianness.Little.value: sys.byteorder != 'little',
+	Endianness.Big.value: sys.byteorder != 'big',
+	Endianness.Network.value: sys.byteorder != 'big',
+}
+
+# Placeholder for the last value given to an Endian setter, before one has been given
+_UNSET = object()
+
 class fpack:
 	"""
 	Fast packing class.
@@ -32,16 +90,29 @@ class fpack:
 
 	Lastly, you can call Pack() directly with any format string you need to use.
 
-	Each call adds data to an internal list.
+	Each call adds data to an internal buffer.
 	Access the Data property to get the resulting binary data string that contains
 	 all of the data supplied to the calls on this object.
 	Further pack arguments can be called if desired.
 	"""
 
+	__slots__ = ('_buffer', '_data', '_endian', '_endian_in', '_endian_char', '_structs', '_scalars', '_needs_swap', '__weakref__')
+
 	def __init__(self, endian=Endianness.Native):
-		self._buffer = []
+		self._buffer = bytearray()
+		self._data = b''
+		self._endian_in = _UNSET
 		self.Endian = endian
 
+	def __getstate__(self):
+		# The cached Struct tables cannot be pickled, so keep only the buffer and endianness and rebuild the rest
+		return (self._buffer, self._endian)
+
+	def __setstate__(self, state):
+		buffer, endian = state
+		self.__init__(endian)
+		self._buffer = buffer
+
 	@property
 	def Endian(self):
 		"""
@@ -55,30 +126,30 @@ class fpack:
 		Sets the endianness.
 		"""
 
-		if type(v) == str:
-			if v == Endianness.Native.value:				v = Endianness.Native
-			elif v == Endianness.NativeNoAlign.value:		v = Endianness.NativeNoAlign
-			elif v == Endianness.Little.value:				v = Endianness.Little
-			elif v == Endianness.Big.value:					v = Endianness.Big
-			elif v == Endianness.Network.value:				v = Endianness.Network
-
-			elif v.lower() == 'native':						v = Endianness.Native
-			elif v.lower() == 'nativenoalign':				v = Endianness.NativeNoAlign
-			elif v.lower() == 'little':						v = Endianness.Little
-			elif v.lower() == 'big':						v = Endianness.Big
-			elif v.lower() == 'net':						v = Endianness.Network
-			elif v.lower() == 'network':					v = Endianness.Network
-
-			else:
-				raise ValueError("Unrecognized v value '%s' expected @, =, <, >, or !, or case-insensitive names native, nativenoalign, little, big, net, or network" % v)
+		# Setting the same value again is common (e.g., toggling in a loop), so skip resolving it
+		if v is self._endian_in:
+			return
 
-		elif type(v) == Endianness:
+		vin = v
+		if type(v) is Endianness:
 			# Nothing to do
 			pass
+		elif type(v) is str:
+			e = _ENDIANS.get(v)
+			if e is None:
+				e = _ENDIANS.get(v.lower())
+			if e is None:
+				raise ValueError("Unrecognized v value '%s' expected @, =, <, >, or !, or case-insensitive names native, nativenoalign, little, big, net, or network" % v)
+			v = e
 		else:
 			raise TypeError("Unrecognized type for v '%s' expected Endianness or string" % type(v))
 
 		self._endian = v
+		self._endian_in = vin
+		self._endian_char = v.value
+		self._structs = _STRUCTS[v.value]
+		self._scalars = _SCALARS[v.value]
+		self._needs_swap = _NEEDS_SWAP[v.value]
 
 	@property
 	def Data(self):
@@ -86,24 +157,71 @@ class fpack:
 		Gets the resulting total buffer output of binary data.
 		"""
 
-		return b''.join(self._buffer)
+		# The buffer is only ever appended to, so the last result is still good if the length hasn't changed
+		if len(self._data) != len(self._buffer):
+			self._data = bytes(self._buffer)
+
+		return self._data
 
 	def Pack(self, fmt, objs):
 		"""
 		Pack wraps struct.pack by using the internal offset counter and the endian specified in the initializer.
 		"""
 
-		e = self.Endian.value
+		# Get the compiled format string
+		s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
 
 		# Pack
-		ret = struct.pack(e + fmt, *objs)
+		ret = s.pack(*objs)
 
 		# Add to buffer
-		self._buffer.append(ret)
+		self._buffer += ret
 
 		# Return unpacked data
 		return ret
 
+	def _short(self, char, vals, conv):
+		"""
+		Shortcut function intended to be used internally only.
+		Values are handed to struct as-is and only converted with @conv if struct rejects them (e.g., 5.0 for an integer).
+		"""
+		# Conversion is retried outside of the except blocks so a failed conversion isn't chained to the struct.error
+		if len(vals) == 1:
+			s = self._scalars[char]
+			try:
+				ret = s.pack(*vals)
+			except struct.error:
+				ret = None
+			if ret is None:
+				ret = s.pack(conv(vals[0]))
+			self._buffer += ret
+			return ret
+		else:
+			fmt = char * len(vals)
+			try:
+				return self.Pack(fmt, vals)
+			except struct.error:
+				pass
+			return self.Pack(fmt, [conv(_) for _ in vals])
+
+	def _array(self, char, seq):
+		"""
+		Puts the values of @seq as struct format character @char, by way of struct for floats and an array.array otherwise.
+		Intended to be used internally only.
+		"""
+		if char in 'fd':
+			# struct converts floats faster than array.array does
+			# A one-off count-prefixed Struct is used so large inputs don't leave a big format cached in _STRUCTS
+			vals = list(seq)
+			self._buffer += struct.Struct('%s%d%s' % (self._endian_char, len(vals), char)).pack(*vals)
+			return None
+
+		arr = array.array(_ARRAY_CODES[char], seq)
+		if self._needs_swap:
+			arr.byteswap()
+		self._buffer += arr
+		return None
+
 	# ----------------------------------------
 	# Other
 
@@ -112,7 +230,7 @@ class fpack:
 		"Write" padding bytes.
 		None is returned always for any amount of @times.
 		"""
-		self.Pack('x' * times, tuple())
+		self._buffer += b'\x00' * times
 		return None
 
 	# ----------------------------------------
@@ -122,29 +240,25 @@ class fpack:
 		"""
 		Puts unsigned 8-bit (1 byte) values.
 		"""
-		times = len(vals)
-		return self.Pack('B'*times, [int(_) for _ in vals])
+		return self._short('B', vals, int)
 
 	def u16(self, *vals):
 		"""
 		Puts unsigned 16-bit (2 bytes) values.
 		"""
-		times = len(vals)
-		return self.Pack('H'*times, [int(_) for _ in vals])
+		return self._short('H', vals, int)
 
 	def u32(self, *vals):
 		"""
 		Puts unsigned 32-bit (4 bytes) values.
 		"""
-		times = len(vals)
-		return self.Pack('I'*times, [int(_) for _ in vals])
+		return self._short('I', vals, int)
 
 	def u64(self, *vals):
 		"""
 		Puts unsigned 64-bit (8 bytes) values.
 		"""
-		times = len(vals)
-		return self.Pack('Q'*times, [int(_) for _ in vals])
+		return self._short('Q', vals, int)
 
 	# ----------------------------------------
 	# Signed
@@ -153,29 +267,25 @@ class fpack:
 		"""
 		Puts signed 8-bit (1 byte) values.
 		"""
-		times = len(vals)
-		return self.Pack('b'*times, [int(_) for _ in vals])
+		return self._short('b', vals, int)
 
 	def s16(self, *vals):
 		"""
 		Puts signed 16-bit (2 bytes) values.
 		"""
-		times = len(vals)
-		return self.Pack('h'*times, [int(_) for _ in vals])
+		return self._short('h', vals, int)
 
 	def s32(self, *vals):
 		"""
 		Puts signed 32-bit (4 bytes) values.
 		"""
-		times = len(vals)
-		return self.Pack('i'*times, [int(_) for _ in vals])
+		return self._short('i', vals, int)
 
 	def s64(self, *vals):
 		"""
 		Puts signed 64-bit (8 bytes) values.
 		"""
-		times = len(vals)
-		return self.Pack('q'*times, [int(_) for _ in vals])
+		return self._short('q', vals, int)
 
 	# ----------------------------------------
 	# Float
@@ -184,15 +294,96 @@ class fpack:
 		"""
 		Puts a 32-bit float value ("float"); 64-bit is a "double" so use f64().
 		"""
-		times = len(vals)
-		return self.Pack('f'*times, [float(_) for _ in vals])
+		return self._short('f', vals, float)
 
 	def f64(self, *vals):
 		"""
 		Puts a 64-bit float value ("float"); 32-bit is a "float" so use f32().
 		"""
-		times = len(vals)
-		return self.Pack('d'*times, [float(_) for _ in vals])
+		return self._short('d', vals, float)
+
+	# ----------------------------------------
+	# Arrays
+
+	def u8_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as unsigned 8-bit (1 byte) values.
+		This is the preferred way to put a large number of values as they are converted in one go by an array.array.
+		None is returned always.
+		"""
+		return self._array('B', seq)
+
+	def u16_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as unsigned 16-bit (2 bytes) values.
+		This is the preferred way to put a large number of values as they are converted in one go by an array.array.
+		None is returned always.
+		"""
+		return self._array('H', seq)
+
+	def u32_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as unsigned 32-bit (4 bytes) values.
+		This is the preferred way to put a large number of values as they are converted in one go by an array.array.
+		None is returned always.
+		"""
+		return self._array('I', seq)
+
+	def u64_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as unsigned 64-bit (8 bytes) values.
+		This is the preferred way to put a large number of values as they are converted in one go by an array.array.
+		None is returned always.
+		"""
+		return self._array('Q', seq)
+
+	def s8_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as signed 8-bit (1 byte) values.
+		This is the preferred way to put a large number of values as they are converted in one go by an array.array.
+		None is returned always.
+		"""
+		return self._array('b', seq)
+
+	def s16_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as signed 16-bit (2 bytes) values.
+		This is the preferred way to put a large number of values as they are converted in one go by an array.array.
+		None is returned always.
+		"""
+		return self._array('h', seq)
+
+	def s32_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as signed 32-bit (4 bytes) values.
+		This is the preferred way to put a large number of values as they are converted in one go by an array.array.
+		None is returned always.
+		"""
+		return self._array('i', seq)
+
+	def s64_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as signed 64-bit (8 bytes) values.
+		This is the preferred way to put a large number of values as they are converted in one go by an array.array.
+		None is returned always.
+		"""
+		return self._array('q', seq)
+
+	def f32_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as 32-bit float ("float") values.
+		This is the preferred way to put a large number of values as they are converted in one go by struct.
+		None is returned always.
+		"""
+		return self._array('f', seq)
+
+	def f64_array(self, seq):
+		"""
+		Puts all values of the iterable @seq as 64-bit float ("double") values.
+		This is the preferred way to put a large number of values as they are converted in one go by struct.
+		None is returned always.
+		"""
+		return self._array('d', seq)
 
 	# ----------------------------------------
 	# puts a binary string of data
@@ -203,8 +394,9 @@ class fpack:
 		"""
 		ret = []
 		for v in vals:
-			z = self.Pack('%ds' % len(v), [v])
-			ret.append(z)
+			# Appended directly so each distinct length doesn't compile and cache a Struct
+			self._buffer += v
+			ret.append(v)
 		return ret
 
 	def string(self, encoding, *vals):
@@ -215,8 +407,8 @@ class fpack:
 		ret = []
 		for v in vals:
 			vv = v.encode(encoding)
-			z = self.Pack('%ds' % len(vv), [vv])
-			ret.append(z)
+			self._buffer += vv
+			ret.append(vv)
 		return ret
 
 	def string_ascii(self, *vals):
@@ -254,165 +446,127 @@ class fpack:
 	# ----------------------------------------
 	# Length-driven write
 
-	def _lendat(self, vals):
+	def _lendat(self, lnchar, datchar, vals):
 		"""
-		Root function that looks at the calling function name to determine the parameters.
-		Accepting function name of the format "u8len_u8dat"
-		 1) Type of length identifier (u=unsigned, signed not accepted as it makes no sense)
-		 2) Bit length of length identifier (8,16,32,64)
-		 3) Type of data identifier (u=unsigned, s=signed)
-		 4) Bit length of data (8,16,32,64)
+		Root function for the length-driven writes.
+		Puts the number of values in @vals as an unsigned length of struct character @lnchar (B, H, I, or Q)
+		 followed by the values as struct character @datchar.
 		"""
 
 		# Length of data to encode
 		ln = len(vals)
 
-		# Get function name of calling function ([0] is current frame, [1] is calling frame)
-		fname = inspect.stack()[1].function
-
-		# Match format of function name
-		r = re.match("^([a-z])([0-9]{1,2})len_([a-z])([0-9]{1,2})dat$", fname)
-		if r is None:
-			raise Exception("Function name '%s' unrecognized" % fname)
-
-		# Convert lengths (8,16,32,64) into numbers
-		lntyp = int(r.group(2))
-		valstyp = int(r.group(4))
-
-		# (1)
-		# Match length type (u = unsigned)
-		if r.group(1) != 'u':
-			raise Exception("Unrecognized array length type: '%s'" % r.group(1))
-
-		# (2)
-		if lntyp == 8:
-			r1 = self.u8(ln)
-		elif lntyp == 16:
-			r1 = self.u16(ln)
-		elif lntyp == 32:
-			r1 = self.u32(ln)
-		elif lntyp == 64:
-			r1 = self.u64(ln)
-		else:
-			raise ValueError("Unrecognized length type: %d" % lntyp)
-
-
-		# (3)
-		if r.group(3) == 'u':
-			signed = False
-		elif r.group(3) == 's':
-			signed = True
-		else:
-			raise Exception("Unrecognized value length type: '%s'" % r.group(2))
-
 		# Ensure length is appropriate
-		if ln >= 2**lntyp:
-			raise ValueError("Cannot encode more than %d items in an %d-bit length; got %d values" % (2**lntyp-1, lntyp, ln))
-
-		# (4)
-		# Encode values
-		if valstyp == 8:
-			if signed:
-				r2 = self.s8(*vals)
-			else:
-				r2 = self.u8(*vals)
-		elif valstyp == 16:
-			if signed:
-				r2 = self.s16(*vals)
-			else:
-				r2 = self.u16(*vals)
-		elif valstyp == 32:
-			if signed:
-				r2 = self.s32(*vals)
-			else:
-				r2 = self.u32(*vals)
-		elif valstyp == 64:
-			if signed:
-				r2 = self.s64(*vals)
-			else:
-				r2 = self.u64(*vals)
+		lnsz = _SIZES[lnchar]
+		lnbits = 8 * lnsz
+		if ln >= 2**lnbits:
+			raise ValueError("Cannot encode more than %d items in an %d-bit length; got %d values" % (2**lnbits-1, lnbits, ln))
+
+		if self._endian == Endianness.Native:
+			# Native alignment would pad between the length and the data, so pack the length on its own
+			lnret = self._scalars[lnchar].pack(ln)
+			fmt = datchar * ln
+			args = vals
 		else:
-			raise NotImplementedError
-
-		return (r1,r2)
+			# Encode length and values with one pack and split the result
+			lnret = None
+			fmt = lnchar + datchar * ln
+			args = [ln, *vals]
+
+		# Values are handed to struct as-is and only converted if struct rejects them, as in _short()
+		s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
+		try:
+			ret = s.pack(*args)
+		except struct.error:
+			ret = None
+		if ret is None:
+			ret = s.pack(*[int(_) for _ in args])
+
+		if lnret is None:
+			self._buffer += ret
+			return (ret[:lnsz], ret[lnsz:])
+
+		self._buffer += lnret
+		self._buffer += ret
+		return (lnret, ret)
 
 	def u8len_u8dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('B', 'B', vals)
 	def u8len_u16dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('B', 'H', vals)
 	def u8len_u32dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('B', 'I', vals)
 	def u8len_u64dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('B', 'Q', vals)
 
 	def u8len_s8dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('B', 'b', vals)
 	def u8len_s16dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('B', 'h', vals)
 	def u8len_s32dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('B', 'i', vals)
 	def u8len_s64dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('B', 'q', vals)
 
 
 
 	def u16len_u8dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('H', 'B', vals)
 	def u16len_u16dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('H', 'H', vals)
 	def u16len_u32dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('H', 'I', vals)
 	def u16len_u64dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('H', 'Q', vals)
 
 	def u16len_s8dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('H', 'b', vals)
 	def u16len_s16dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('H', 'h', vals)
 	def u16len_s32dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('H', 'i', vals)
 	def u16len_s64dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('H', 'q', vals)
 
 
 
 	def u32len_u8dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('I', 'B', vals)
 	def u32len_u16dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('I', 'H', vals)
 	def u32len_u32dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('I', 'I', vals)
 	def u32len_u64dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('I', 'Q', vals)
 
 	def u32len_s8dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('I', 'b', vals)
 	def u32len_s16dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('I', 'h', vals)
 	def u32len_s32dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('I', 'i', vals)
 	def u32len_s64dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('I', 'q', vals)
 
 
 
 	def u64len_u8dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('Q', 'B', vals)
 	def u64len_u16dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('Q', 'H', vals)
 	def u64len_u32dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('Q', 'I', vals)
 	def u64len_u64dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('Q', 'Q', vals)
 
 	def u64len_s8dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('Q', 'b', vals)
 	def u64len_s16dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('Q', 'h', vals)
 	def u64len_s32dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('Q', 'i', vals)
 	def u64len_s64dat(self, *vals):
-		return self._lendat(vals)
+		return self._lendat('Q', 'q', vals)
 
 
 class funpack:
@@ -429,18 +583,36 @@ class funpack:
 	Lastly, you can call Unpack() directly with any format string you need to use.
 	"""
 
-	def __init__(self, src, endian=Endianness.Native, offset=0):
+	__slots__ = ('_src', '_mv', '_smv', '_arrays', '_offset', '_endian', '_endian_in', '_endian_char', '_structs', '_scalars', '_needs_swap', '__weakref__')
+
+	def __init__(self, src, endian=Endianness.Native, offset=0, arrays=False):
 		"""
 		Initialize the fast unpacker with data source @src and use the endian @endian for all unpacks.
 		@src is any type that struct.unpack() accepts.
+		 It is read through a memoryview, so a mutable source (e.g., bytearray) cannot be resized while in use (until close() is called),
+		 and changes to its contents are seen by later reads.
+		 Likewise, an mmap source cannot be closed until close() is called on the unpacker.
 		@endian can be either a character (@, =, <, >, or !), case-insentivie names (native, nativenoalign, little, big, net, or network) or an Endianness enum value.
 		@offset is the default offset to start unpacking from.
+		@arrays, if True, returns multi-value reads (@times not one) as an array.array instead of a tuple.
+		 This avoids creating a Python object for every value up front and is much faster for large reads.
 		"""
 
-		self._src = src
-		self.Offset = offset
+		self._mv = None
+		self.Src = src
+		self._arrays = arrays
+		self._offset = offset
+		self._endian_in = _UNSET
 		self.Endian = endian
 
+	def __getstate__(self):
+		# The views on the source and the cached Struct tables cannot be pickled, so keep only what is needed to rebuild them
+		return (self._src, self._offset, self._endian, self._arrays)
+
+	def __setstate__(self, state):
+		src, offset, endian, arrays = state
+		self.__init__(src, endian, offset, arrays)
+
 	@property
 	def Src(self):
 		"""
@@ -448,6 +620,33 @@ class funpack:
 		"""
 		return self._src
 
+	@Src.setter
+	def Src(self, v):
+		"""
+		Sets the data source the unpacking is performed on; the offset is left unchanged.
+		This lets an unpacker be reused for a new buffer, and the previous source is released so it can be resized again.
+		"""
+		# Wrap the new source first so a bad one leaves the unpacker as it was
+		mv = memoryview(v).cast('B').toreadonly()
+		smv = mv.cast('b')
+
+		if self._mv is not None:
+			self.close()
+
+		self._src = v
+		self._mv = mv
+		self._smv = smv
+
+	def close(self):
+		"""
+		Releases the views held on the data source, so a mutable source (e.g., bytearray) can be resized again, or an mmap closed.
+		Views handed out earlier by bytes_view(), and iterators from the iter_*() functions or IterRecords() that are not yet exhausted,
+		 still hold the source; it cannot be resized or closed until they are released too.
+		Reads after this raise ValueError until a new source is given through Src.
+		"""
+		self._smv.release()
+		self._mv.release()
+
 	@property
 	def Offset(self):
 		"""
@@ -474,14 +673,14 @@ class funpack:
 		"""
 		Gets the total bytes..
 		"""
-		return len(self._src)
+		return len(self._mv)
 
 	@property
 	def Remains(self):
 		"""
 		Gets the remaining bytes left.
 		"""
-		return self.Length - self.Offset
+		return len(self._mv) - self._offset
 
 	@Endian.setter
 	def Endian(self, v):
@@ -489,50 +688,135 @@ class funpack:
 		Sets the endianness.
 		"""
 
-		if type(v) == str:
-			if v == Endianness.Native.value:				v = Endianness.Native
-			elif v == Endianness.NativeNoAlign.value:		v = Endianness.NativeNoAlign
-			elif v == Endianness.Little.value:				v = Endianness.Little
-			elif v == Endianness.Big.value:					v = Endianness.Big
-			elif v == Endianness.Network.value:				v = Endianness.Network
-
-			elif v.lower() == 'native':						v = Endianness.Native
-			elif v.lower() == 'nativenoalign':				v = Endianness.NativeNoAlign
-			elif v.lower() == 'little':						v = Endianness.Little
-			elif v.lower() == 'big':						v = Endianness.Big
-			elif v.lower() == 'net':						v = Endianness.Network
-			elif v.lower() == 'network':					v = Endianness.Network
-
-			else:
-				raise ValueError("Unrecognized v value '%s' expected @, =, <, >, or !, or case-insensitive names native, nativenoalign, little, big, net, or network" % v)
+		# Setting the same value again is common (e.g., toggling in a loop), so skip resolving it
+		if v is self._endian_in:
+			return
 
-		elif type(v) == Endianness:
+		vin = v
+		if type(v) is Endianness:
 			# Nothing to do
 			pass
+		elif type(v) is str:
+			e = _ENDIANS.get(v)
+			if e is None:
+				e = _ENDIANS.get(v.lower())
+			if e is None:
+				raise ValueError("Unrecognized v value '%s' expected @, =, <, >, or !, or case-insensitive names native, nativenoalign, little, big, net, or network" % v)
+			v = e
 		else:
 			raise TypeError("Unrecognized type for v '%s' expected Endianness or string" % type(v))
 
 		self._endian = v
+		self._endian_in = vin
+		self._endian_char = v.value
+		self._structs = _STRUCTS[v.value]
+		self._scalars = _SCALARS[v.value]
+		self._needs_swap = _NEEDS_SWAP[v.value]
 
 	def Unpack(self, fmt):
 		"""
 		Unpack wraps struct.unpack by using the internal offset counter and the endian specified in the initializer.
 		"""
 
-		e = self.Endian.value
-
-		# Get the size of the format string
-		sz = struct.calcsize(e + fmt)
+		# Get the compiled format string
+		s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
 
 		# Unpack
-		ret = struct.unpack_from(e + fmt, self._src, self.Offset)
+		ret = s.unpack_from(self._mv, self._offset)
 
 		# Increment offset
-		self.Offset += sz
+		self._offset += s.size
 
 		# Return unpacked data
 		return ret
 
+	def UnpackMany(self, *fmts):
+		"""
+		Unpacks several format strings @fmts back to back with a single struct call and returns all results in one tuple.
+		Use this when decoding a header of many fields as the offset is only advanced once.
+		"""
+
+		fmt = ''.join(fmts)
+		s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
+
+		ret = s.unpack_from(self._mv, self._offset)
+
+		self._offset += s.size
+
+		return ret
+
+	def Skip(self, ln):
+		"""
+		Skips @ln bytes without unpacking anything.
+		"""
+		self._offset += ln
+
+	@contextlib.contextmanager
+	def Savepoint(self):
+		"""
+		Context manager that restores the offset if an exception is raised within the block.
+		Useful for speculative parsing: try to unpack something and rewind if it turns out to be something else.
+		The saved offset is provided as the target of the with statement.
+		"""
+		o = self._offset
+		try:
+			yield o
+		except:
+			self._offset = o
+			raise
+
+	def Compile(self, fmt, names=None):
+		"""
+		Compiles format string @fmt with the current endianness into a standalone decoder function.
+		The decoder is called as dec(src, offset) and returns a tuple of (values, offset after the values).
+		If @names is supplied (a list or space-separated string of field names), values is a namedtuple with those fields.
+		Reuse the decoder when decoding many records of the same layout to bypass the funpack object entirely.
+		"""
+
+		s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
+		unpack_from = s.unpack_from
+		size = s.size
+
+		if names is None:
+			def dec(src, offset=0):
+				return (unpack_from(src, offset), offset + size)
+		else:
+			layout = collections.namedtuple('Layout', names)
+			nfields = len(s.unpack(bytes(s.size)))
+			if len(layout._fields) != nfields:
+				raise ValueError("Format '%s' has %d fields but %d names were given" % (fmt, nfields, len(layout._fields)))
+
+			make = layout._make
+			def dec(src, offset=0):
+				return (make(unpack_from(src, offset)), offset + size)
+
+		return dec
+
+	def IterRecords(self, fmt, count):
+		"""
+		Returns an iterator over @count consecutive records of format string @fmt, each a tuple as Unpack() would return.
+		The offset is advanced past all of the records immediately; each record is unpacked as the iterator is consumed.
+		"""
+
+		s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
+
+		return s.iter_unpack(self._take(s.size * count))
+
+	def UnpackRecords(self, fmt, count):
+		"""
+		Unpacks @count consecutive records of format string @fmt and returns them as columns.
+		A tuple is returned containing one tuple per field holding that field's value from every record.
+		Looping over the records is done within the struct module, so this is much faster than calling Unpack() in a loop.
+		"""
+
+		s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
+
+		cols = tuple(zip(*s.iter_unpack(self._take(s.size * count))))
+		if not cols:
+			# No records, but still one (empty) column per field so the result can be unpacked into names
+			return ((),) * len(s.unpack(bytes(s.size)))
+		return cols
+
 	# --------------------------------------------------------------------------------
 	# --------------------------------------------------------------------------------
 	# Shortcut functions
@@ -540,9 +824,63 @@ class funpack:
 	def _short(self, char, times):
 		"""Shortcut function intended to be used internally only."""
 		if times == 1:
-			return self.Unpack(char)[0]
+			s = self._scalars[char]
+			v = s.unpack_from(self._mv, self._offset)[0]
+			self._offset += s.size
+			return v
+		elif self._arrays:
+			return self._array(char, times)
 		else:
-			return self.Unpack(char * times)
+			fmt = char * times
+			s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
+			v = s.unpack_from(self._mv, self._offset)
+			self._offset += s.size
+			return v
+
+	def _byte(self, view, o):
+		"""
+		Gets the byte at offset @o of @view (the unsigned or signed byte view), raising struct.error as unpack_from would if it is out of range.
+		Intended to be used internally only.
+		"""
+		try:
+			return view[o]
+		except IndexError:
+			raise struct.error("unpack_from offset %d out of range for %d-byte buffer" % (o, len(view))) from None
+
+	def _take(self, ln):
+		"""
+		Gets a view of the next @ln bytes and advances the offset past them.
+		Intended to be used internally only.
+		"""
+		if ln < 0:
+			raise struct.error("cannot read a negative number of bytes (%d)" % ln)
+
+		o = self._offset
+		start = o + len(self._mv) if o < 0 else o
+		if start < 0 or start + ln > len(self._mv):
+			raise struct.error("unpack_from requires a buffer of at least %d bytes at offset %d (actual buffer size is %d)" % (ln, o, len(self._mv)))
+
+		self._offset = o + ln
+		return self._mv[start:start + ln]
+
+	def _array(self, char, times):
+		"""
+		Reads @times values of struct format character @char into an array.array.
+		Intended to be used internally only.
+		"""
+		a = array.array(_ARRAY_CODES[char])
+		a.frombytes(self._take(a.itemsize * times))
+		if self._needs_swap:
+			a.byteswap()
+		return a
+
+	def _iter(self, char, times):
+		"""
+		Returns an iterator over @times values of struct format character @char, advancing the offset past all of them now.
+		Intended to be used internally only.
+		"""
+		s = self._scalars[char]
+		return (t[0] for t in s.iter_unpack(self._take(s.size * times)))
 
 	# ----------------------------------------
 	# Other
@@ -552,7 +890,7 @@ class funpack:
 		"Read" padding bytes, which means nothing is actually read.
 		None is returned always for any amount of @times.
 		"""
-		self.Unpack('x' * times)
+		self._offset += times
 		return None
 
 	# ----------------------------------------
@@ -564,6 +902,12 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			# Indexing the byte view is cheaper than any struct call
+			o = self._offset
+			v = self._byte(self._mv, o)
+			self._offset = o + 1
+			return v
 		return self._short('B', times)
 
 	def u16(self, times=1):
@@ -572,6 +916,11 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			o = self._offset
+			v = self._scalars['H'].unpack_from(self._mv, o)[0]
+			self._offset = o + 2
+			return v
 		return self._short('H', times)
 
 	def u32(self, times=1):
@@ -580,6 +929,11 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			o = self._offset
+			v = self._scalars['I'].unpack_from(self._mv, o)[0]
+			self._offset = o + 4
+			return v
 		return self._short('I', times)
 
 	def u64(self, times=1):
@@ -588,6 +942,11 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			o = self._offset
+			v = self._scalars['Q'].unpack_from(self._mv, o)[0]
+			self._offset = o + 8
+			return v
 		return self._short('Q', times)
 
 	# ----------------------------------------
@@ -599,6 +958,12 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			# Indexing the signed byte view is cheaper than any struct call
+			o = self._offset
+			v = self._byte(self._smv, o)
+			self._offset = o + 1
+			return v
 		return self._short('b', times)
 
 	def s16(self, times=1):
@@ -607,6 +972,11 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			o = self._offset
+			v = self._scalars['h'].unpack_from(self._mv, o)[0]
+			self._offset = o + 2
+			return v
 		return self._short('h', times)
 
 	def s32(self, times=1):
@@ -615,6 +985,11 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			o = self._offset
+			v = self._scalars['i'].unpack_from(self._mv, o)[0]
+			self._offset = o + 4
+			return v
 		return self._short('i', times)
 
 	def s64(self, times=1):
@@ -623,6 +998,11 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			o = self._offset
+			v = self._scalars['q'].unpack_from(self._mv, o)[0]
+			self._offset = o + 8
+			return v
 		return self._short('q', times)
 
 	# ----------------------------------------
@@ -634,6 +1014,11 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			o = self._offset
+			v = self._scalars['f'].unpack_from(self._mv, o)[0]
+			self._offset = o + 4
+			return v
 		return self._short('f', times)
 
 	def f64(self, times=1):
@@ -642,8 +1027,164 @@ class funpack:
 		If @times is one, then the integer is returned.
 		If @times is not one, then a tuple of integers is returned.
 		"""
+		if times == 1:
+			o = self._offset
+			v = self._scalars['d'].unpack_from(self._mv, o)[0]
+			self._offset = o + 8
+			return v
 		return self._short('d', times)
 
+	# ----------------------------------------
+	# Arrays
+
+	def u8_array(self, times):
+		"""
+		Gets @times unsigned 8-bit (1 byte) values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('B', times)
+
+	def u16_array(self, times):
+		"""
+		Gets @times unsigned 16-bit (2 bytes) values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('H', times)
+
+	def u32_array(self, times):
+		"""
+		Gets @times unsigned 32-bit (4 bytes) values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('I', times)
+
+	def u64_array(self, times):
+		"""
+		Gets @times unsigned 64-bit (8 bytes) values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('Q', times)
+
+	def s8_array(self, times):
+		"""
+		Gets @times signed 8-bit (1 byte) values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('b', times)
+
+	def s16_array(self, times):
+		"""
+		Gets @times signed 16-bit (2 bytes) values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('h', times)
+
+	def s32_array(self, times):
+		"""
+		Gets @times signed 32-bit (4 bytes) values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('i', times)
+
+	def s64_array(self, times):
+		"""
+		Gets @times signed 64-bit (8 bytes) values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('q', times)
+
+	def f32_array(self, times):
+		"""
+		Gets @times 32-bit float ("float") values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('f', times)
+
+	def f64_array(self, times):
+		"""
+		Gets @times 64-bit float ("double") values as an array.array.
+		This is the preferred way to read a large number of values as no Python object is created per value until accessed.
+		"""
+		return self._array('d', times)
+
+	def ReadInto(self, out):
+		"""
+		Reads values into the existing, writable array.array @out, filling it completely, and returns @out.
+		The value type and count are taken from @out, so nothing is allocated; useful when reading same-sized arrays repeatedly.
+		"""
+		# Check the target before moving the offset so a bad one doesn't skip any data
+		if not isinstance(out, array.array):
+			raise TypeError("ReadInto requires an array.array, got %s" % type(out).__name__)
+
+		m = memoryview(out).cast('B')
+		m[:] = self._take(len(m))
+		if self._needs_swap:
+			out.byteswap()
+		return out
+
+	# ----------------------------------------
+	# Iterators
+
+	def iter_u8(self, times):
+		"""
+		Returns an iterator over @times unsigned 8-bit integer values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('B', times)
+
+	def iter_s8(self, times):
+		"""
+		Returns an iterator over @times signed 8-bit integer values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('b', times)
+
+	def iter_u16(self, times):
+		"""
+		Returns an iterator over @times unsigned 16-bit integer values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('H', times)
+
+	def iter_s16(self, times):
+		"""
+		Returns an iterator over @times signed 16-bit integer values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('h', times)
+
+	def iter_u32(self, times):
+		"""
+		Returns an iterator over @times unsigned 32-bit integer values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('I', times)
+
+	def iter_s32(self, times):
+		"""
+		Returns an iterator over @times signed 32-bit integer values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('i', times)
+
+	def iter_u64(self, times):
+		"""
+		Returns an iterator over @times unsigned 64-bit integer values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('Q', times)
+
+	def iter_s64(self, times):
+		"""
+		Returns an iterator over @times signed 64-bit integer values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('q', times)
+
+	def iter_f32(self, times):
+		"""
+		Returns an iterator over @times 32-bit float ("single") values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('f', times)
+
+	def iter_f64(self, times):
+		"""
+		Returns an iterator over @times 64-bit float ("double") values, unpacked one at a time as it is consumed.
+		"""
+		return self._iter('d', times)
+
 	# ----------------------------------------
 	# Gets a binary string of data
 
@@ -652,7 +1193,14 @@ class funpack:
 		Gets a binary string of bytes.
 		@ln is number of bytes to return as a bytes string.
 		"""
-		return self.Unpack('%ds' % ln)[0]
+		return self._take(ln).tobytes()
+
+	def bytes_view(self, ln):
+		"""
+		Gets a read-only memoryview of the next @ln bytes without copying them.
+		Use this instead of bytes() for large payloads that are only inspected, sliced, or passed along.
+		"""
+		return self._take(ln)
 
 	def string(self, ln, encoding):
 		"""
@@ -660,7 +1208,7 @@ class funpack:
 		@ln is number of bytes to unpack (not the number of characters).
 		@encoding is the text encoding used.
 		"""
-		return self.bytes(ln).decode(encoding)
+		return str(self._take(ln), encoding)
 
 	def string_ascii(self, ln):
 		"""
@@ -668,7 +1216,7 @@ class funpack:
 		This is a convenience function to string().
 		@ln is number of bytes to unpack (not the number of characters).
 		"""
-		return self.bytes(ln).decode('ascii')
+		return str(self._take(ln), 'ascii')
 
 	def string_utf8(self, ln):
 		"""
@@ -676,7 +1224,7 @@ class funpack:
 		This is a convenience function to string().
 		@ln is number of bytes to unpack (not the number of characters).
 		"""
-		return self.bytes(ln).decode('utf-8')
+		return str(self._take(ln), 'utf-8')
 
 	def string_utf16(self, ln):
 		"""
@@ -684,7 +1232,7 @@ class funpack:
 		This is a convenience function to string().
 		@ln is number of bytes to unpack (not the number of characters).
 		"""
-		return self.bytes(ln).decode('utf-16')
+		return str(self._take(ln), 'utf-16')
 
 	def string_utf32(self, ln):
 		"""
@@ -692,11 +1240,36 @@ class funpack:
 		This is a convenience function to string().
 		@ln is number of bytes to unpack (not the number of characters).
 		"""
-		return self.bytes(ln).decode('utf-32')
+		return str(self._take(ln), 'utf-32')
 
 	# ----------------------------------------
 	# Length-driven reads
 
+	def _lendat(self, lnchar, datchar):
+		"""
+		Root function for the length-driven reads.
+		Reads an unsigned length of struct character @lnchar and then that many values of struct character @datchar.
+		Intended to be used internally only.
+		"""
+		o = self._offset
+		if lnchar == 'B':
+			# Indexing the byte view is cheaper than any struct call
+			ln = self._byte(self._mv, o)
+		else:
+			ln = self._scalars[lnchar].unpack_from(self._mv, o)[0]
+		o += _SIZES[lnchar]
+
+		if ln == 1 or self._arrays:
+			self._offset = o
+			return self._short(datchar, ln)
+
+		# Read the data with the cached struct for this length and advance the offset once for both
+		fmt = datchar * ln
+		s = self._structs.get(fmt) or _compile(self._endian_char, fmt)
+		v = s.unpack_from(self._mv, o)
+		self._offset = o + s.size
+		return v
+
 	# u8 length, unsigned data
 
 	def u8len_u8dat(self):
@@ -704,32 +1277,28 @@ class funpack:
 		Reads an unsigned 8-bit value as a length and that many unsigned 8-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.u8(ln)
+		return self._lendat('B', 'B')
 
 	def u8len_u16dat(self):
 		"""
 		Reads an unsigned 8-bit value as a length and that many unsigned 16-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.u16(ln)
+		return self._lendat('B', 'H')
 
 	def u8len_u32dat(self):
 		"""
 		Reads an unsigned 8-bit value as a length and that many unsigned 32-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.u32(ln)
+		return self._lendat('B', 'I')
 
 	def u8len_u64dat(self):
 		"""
 		Reads an unsigned 8-bit value as a length and that many unsigned 64-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.u64(ln)
+		return self._lendat('B', 'Q')
 
 	# ---------
 	# u8 length, signed data
@@ -739,32 +1308,28 @@ class funpack:
 		Reads an unsigned 8-bit value as a length and that many signed 8-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.s8(ln)
+		return self._lendat('B', 'b')
 
 	def u8len_s16dat(self):
 		"""
 		Reads an unsigned 8-bit value as a length and that many signed 16-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.s16(ln)
+		return self._lendat('B', 'h')
 
 	def u8len_s32dat(self):
 		"""
 		Reads an unsigned 8-bit value as a length and that many signed 32-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.s32(ln)
+		return self._lendat('B', 'i')
 
 	def u8len_s64dat(self):
 		"""
 		Reads an unsigned 8-bit value as a length and that many signed 64-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.s64(ln)
+		return self._lendat('B', 'q')
 
 	# ---------
 	# u16 length, unsigned data
@@ -774,32 +1339,28 @@ class funpack:
 		Reads an unsigned 16-bit value as a length and that many unsigned 8-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.u8(ln)
+		return self._lendat('H', 'B')
 
 	def u16len_u16dat(self):
 		"""
 		Reads an unsigned 16-bit value as a length and that many unsigned 16-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.u16(ln)
+		return self._lendat('H', 'H')
 
 	def u16len_u32dat(self):
 		"""
 		Reads an unsigned 16-bit value as a length and that many unsigned 32-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.u32(ln)
+		return self._lendat('H', 'I')
 
 	def u16len_u64dat(self):
 		"""
 		Reads an unsigned 16-bit value as a length and that many unsigned 64-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.u64(ln)
+		return self._lendat('H', 'Q')
 
 	# ---------
 	# u16 length, signed data
@@ -809,32 +1370,28 @@ class funpack:
 		Reads an unsigned 16-bit value as a length and that many signed 8-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.s8(ln)
+		return self._lendat('H', 'b')
 
 	def u16len_s16dat(self):
 		"""
 		Reads an unsigned 16-bit value as a length and that many signed 16-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.s16(ln)
+		return self._lendat('H', 'h')
 
 	def u16len_s32dat(self):
 		"""
 		Reads an unsigned 16-bit value as a length and that many signed 32-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.s32(ln)
+		return self._lendat('H', 'i')
 
 	def u16len_s64dat(self):
 		"""
 		Reads an unsigned 16-bit value as a length and that many signed 64-bit values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.s64(ln)
+		return self._lendat('H', 'q')
 
 	# ---------
 	# u8 and u16 length, 32-bit float data
@@ -844,45 +1401,49 @@ class funpack:
 		Reads an unsigned 8-bit value as a length and that many 32-bit float values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.f32(ln)
+		return self._lendat('B', 'f')
 
 	def u8len_f64dat(self):
 		"""
 		Reads an unsigned 8-bit value as a length and that many 64-bit float values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u8()
-		return self.f64(ln)
+		return self._lendat('B', 'd')
 
 	def u16len_f32dat(self):
 		"""
 		Reads an unsigned 16-bit value as a length and that many 32-bit float values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.f32(ln)
+		return self._lendat('H', 'f')
 
 	def u16len_f64dat(self):
 		"""
 		Reads an unsigned 16-bit value as a length and that many 64-bit float values are read and returned.
 		The length is not returned, but if you need it you should just make the two calls yourself.
 		"""
-		ln = self.u16()
-		return self.f64(ln)
+		return self._lendat('H', 'd')
 
 	# ----------------------------------------
 	# Offset jumps
 
+	def _jump(self, char, multiplier, tweak):
+		"""
+		Reads the unsigned length @char and moves the offset past it by @multiplier times the length plus @tweak.
+		"""
+		s = self._scalars[char]
+		o = self._offset
+		ln = s.unpack_from(self._mv, o)[0]
+		self._offset = o + s.size + multiplier*ln + tweak
+		return ln
+
 	def u8jump(self, multiplier=1, tweak=0):
 		"""
 		Read an unsigned 8-bit value, and jump offset by that much.
 		The @multiplier is a multiple of the jump value.
 		Also, @tweak may can tweak the jumped offset (after multiplying by @multiplier).
 		"""
-		ln = self.u8()
-		self.Offset += multiplier*ln + tweak
-		return ln
+		return self._jump('B', multiplier, tweak)
 
 	def u16jump(self, multiplier=1, tweak=0):
 		"""
@@ -890,9 +1451,7 @@ class funpack:
 		The @multiplier is a multiple of the jump value.
 		Also, @tweak may can tweak the jumped offset (after multiplying by @multiplier).
 		"""
-		ln = self.u16()
-		self.Offset += multiplier*ln + tweak
-		return ln
+		return self._jump('H', multiplier, tweak)
 
 	def u32jump(self, multiplier=1, tweak=0):
 		"""
@@ -900,9 +1459,7 @@ class funpack:
 		The @multiplier is a multiple of the jump value.
 		Also, @tweak may can tweak the jumped offset (after multiplying by @multiplier).
 		"""
-		ln = self.u32()
-		self.Offset += multiplier*ln + tweak
-		return ln
+		return self._jump('I', multiplier, tweak)
 
 	def u64jump(self, multiplier=1, tweak=0):
 		"""
@@ -910,14 +1467,13 @@ class funpack:
 		The @multiplier is a multiple of the jump value.
 		Also, @tweak may can tweak the jumped offset (after multiplying by @multiplier).
 		"""
-		ln = self.u64()
-		self.Offset += multiplier*ln + tweak
-		return ln
+		return self._jump('Q', multiplier, tweak)
 
 
 
 
 def test():
+	test_endian()
 	test_fpack()
 	test_funpack()
 
@@ -928,6 +1484,14 @@ def test_fpack():
 	f.u8(5)
 	assert(f.Data == struct.pack("<B", 5))
 
+	import copy, pickle, weakref
+	assert(weakref.ref(f)() is f)
+	for g in [pickle.loads(pickle.dumps(f)), copy.deepcopy(f)]:
+		assert(g.Endian == Endianness.Little and g.Data == f.Data)
+		g.u16(6)
+		assert(g.Data == struct.pack("<BH", 5, 6))
+		assert(f.Data == struct.pack("<B", 5))
+
 	f = fpack(Endianness.Little)
 	f.s8(5)
 	assert(f.Data == struct.pack("<b", 5))
@@ -958,6 +1522,68 @@ def test_fpack():
 	f.s64(5, 10, 20)
 	assert(f.Data == struct.pack("<qqq", 5, 10, 20))
 
+	f = fpack()
+	f.u8(1)
+	f.pad(3)
+	assert(f.Data == b'\x01\x00\x00\x00')
+
+	# Values that struct rejects are still converted
+	f = fpack(Endianness.Big)
+	f.u8(5.0)
+	f.u16("6", 7.0)
+	f.f32("1.5")
+	assert(f.Data == struct.pack(">BHHf", 5, 6, 7, 1.5))
+	try:
+		f.u8(256)
+		assert(False)
+	except struct.error:
+		pass
+
+	# ------------- arrays -------------
+	for e in ['<', '>']:
+		f = fpack(e)
+		f.u8_array(range(5))
+		f.u16_array(range(5))
+		f.u32_array(range(5))
+		f.u64_array(range(5))
+		f.s8_array([-1, 1])
+		f.s16_array([-1, 1])
+		f.s32_array([-1, 1])
+		f.s64_array([-1, 1])
+		f.f32_array([1.25, 2.5])
+		f.f64_array([1.25, 2.5])
+		assert(f.Data == struct.pack(e + "5B5H5I5Q2b2h2i2q2f2d", *(list(range(5))*4 + [-1, 1]*4 + [1.25, 2.5]*2)))
+		# Bulk float formats are not kept in the shared cache
+		f.f32_array([0.0] * 37)
+		assert('f' * 37 not in _STRUCTS[e] and '37f' not in _STRUCTS[e])
+
+	# ------------- failed coercion -------------
+	for e in ['<', '@']:
+		f = fpack(e)
+		f.u16len_u8dat(1, 2.0)
+		for fn in [lambda: f.u8('abc'), lambda: f.u8(1, 'abc'), lambda: f.u16len_u8dat(1, 'abc')]:
+			try:
+				fn()
+				assert(False)
+			except ValueError as ex:
+				assert(ex.__context__ is None)
+		assert(f.Data == struct.pack(e + 'H', 2) + b'\x01\x02')
+
+	# ------------- bytes and strings -------------
+	f = fpack(Endianness.Big)
+	assert(f.bytes(b'abc', b'') == [b'abc', b''])
+	assert(f.string_utf8('h\u00e9') == [b'h\xc3\xa9'])
+	assert(f.Data == b'abch\xc3\xa9')
+	assert('3s' not in _STRUCTS['>'])
+
+	# ------------- cached data -------------
+	f = fpack(Endianness.Big)
+	f.u8(1)
+	d = f.Data
+	assert(f.Data is d)
+	f.u8(2)
+	assert(f.Data == b'\x01\x02')
+
 	f = fpack()
 	f.string("ascii", "Hello")
 	assert(f.Data == struct.pack("<5s", "Hello".encode('ascii')))
@@ -1094,6 +1720,42 @@ def test_fpack():
 	f.u64len_u64dat(*list(range(50)))
 	assert(f.Data == lenpack64(50, "Q"))
 
+	f = fpack(Endianness.Big)
+	assert(f.u16len_s16dat(-1, 2) == (b'\x00\x02', b'\xff\xff\x00\x02'))
+
+	# Native alignment must not add padding between the length and the data
+	f = fpack(Endianness.Native)
+	f.u8len_u32dat(1, 2)
+	assert(f.Data == struct.pack("@B", 2) + struct.pack("@II", 1, 2))
+
+
+def test_endian():
+	for v,e in [('@', Endianness.Native), ('=', Endianness.NativeNoAlign), ('<', Endianness.Little), ('>', Endianness.Big), ('!', Endianness.Network),
+			('Native', Endianness.Native), ('NATIVENOALIGN', Endianness.NativeNoAlign), ('little', Endianness.Little), ('Big', Endianness.Big), ('net', Endianness.Network), ('Network', Endianness.Network),
+			(Endianness.Big, Endianness.Big)]:
+		assert(fpack(v).Endian == e)
+		assert(funpack(b'', endian=v).Endian == e)
+
+	for v in ['', 'x', 'bigger']:
+		try:
+			funpack(b'', endian=v)
+			assert(False)
+		except ValueError:
+			pass
+
+	for v in [1, None]:
+		try:
+			fpack(v)
+			assert(False)
+		except TypeError:
+			pass
+
+	f = funpack(struct.pack('<H', 1), endian='<')
+	f.Endian = '<'
+	assert(f.Endian == Endianness.Little)
+	f.Endian = '>'
+	f.Endian = Endianness.Big
+	assert(f.u16() == 256)
 
 def test_funpack():
 	dat = struct.pack(Endianness.Big.value + "B"*10 + "H"*10 + "I"*10 + "Q"*10 + "fdf", *(list(range(40)) + [1.25, 2.5, 3.75]))
@@ -1162,6 +1824,22 @@ def test_funpack():
 	assert(f.u8len_u32dat() == (0,1,2,3,4,5,6,7,8,9,10,11,12,13,14,15,16,17,18,19,20,21,22,23,24,25,26,27,28,29))
 
 
+	# ------------- len 1 and 0, 16-bit length -------------
+	f = funpack(struct.pack(">HhHH", 1, -5, 0, 2) + struct.pack(">2f", 1.5, 2.5), endian=Endianness.Big)
+	assert(f.u16len_s16dat() == -5)
+	assert(f.u16len_u8dat() == ())
+	assert(f.u16len_f32dat() == (1.5, 2.5))
+	assert(f.Remains == 0)
+
+	try:
+		funpack(b'').u8len_u8dat()
+		assert(False)
+	except struct.error:
+		pass
+
+	f = funpack(lenpack(3, "H"), endian=Endianness.Big, arrays=True)
+	assert(f.u8len_u16dat() == array.array('H', [0,1,2]))
+
 	def jumppack(ln, jmp, char):
 		return struct.pack(Endianness.Big.value + "B" + char*ln, *([jmp] + list(range(ln))))
 
@@ -1185,6 +1863,12 @@ def test_funpack():
 	assert(f.u8jump(multiplier=8) == 3)
 	assert(f.u64() == 3)
 
+	# ------------- 16-bit jump with tweak -------------
+	f = funpack(struct.pack(">H", 2) + bytes(range(10)), endian=Endianness.Big)
+	assert(f.u16jump(multiplier=2, tweak=1) == 2)
+	assert(f.Offset == 7)
+	assert(f.u8() == 5)
+
 	# ------------- bytes -------------
 	z = "hello world, I am Taco!"
 	f = funpack(z.encode('ascii'), endian=Endianness.Big)
@@ -1193,6 +1877,174 @@ def test_funpack():
 	assert(f.bytes(5) == z[6:11].encode('ascii'))
 	assert(f.bytes(12) == z[11:].encode('ascii'))
 
+	# ------------- arrays -------------
+	f = funpack(dat, endian=Endianness.Big, arrays=True)
+	assert(f.u8() == 0)
+	assert(f.u8(9) == array.array('B', range(1, 10)))
+	assert(f.u16(10) == array.array('H', range(10, 20)))
+	assert(f.u32(10).tolist() == list(range(20, 30)))
+	assert(f.u64(10).tolist() == list(range(30, 40)))
+	assert(f.f32() == 1.25)
+	try:
+		f.f64(2)
+		assert(False)
+	except struct.error:
+		pass
+
+	# ------------- many -------------
+	f = funpack(struct.pack(">BHIQ", 1, 2, 3, 4) + b'\x00\x00\x05', endian=Endianness.Big)
+	assert(f.UnpackMany("B", "H", "IQ") == (1,2,3,4))
+	f.Skip(2)
+	assert(f.u8() == 5)
+
+	# ------------- savepoint -------------
+	f = funpack(b'\x01\x02\x03')
+	try:
+		with f.Savepoint() as o:
+			assert(o == 0)
+			f.u16()
+			f.u16()
+	except struct.error:
+		pass
+	assert(f.Offset == 0)
+	with f.Savepoint():
+		f.u16()
+	assert(f.Offset == 2)
+
+	# ------------- compile -------------
+	for names in ["a", "a b c"]:
+		try:
+			funpack(b'').Compile("BH", names)
+			assert(False)
+		except ValueError:
+			pass
+	dec = funpack(b'', endian=Endianness.Big).Compile("BH", "a b")
+	v,o = dec(b'\x00\x01\x00\x02', 1)
+	assert(v == (1,2) and v.b == 2 and o == 4)
+
+	# ------------- typed arrays -------------
+	f = funpack(dat, endian=Endianness.Big)
+	assert(f.u8_array(10) == array.array('B', range(10)))
+	assert(f.u16_array(10).tolist() == list(range(10, 20)))
+	assert(f.u32_array(10).tolist() == list(range(20, 30)))
+	assert(f.u64_array(10).tolist() == list(range(30, 40)))
+	assert(f.f32_array(1).tolist() == [1.25])
+	assert(f.f64_array(1).tolist() == [2.5])
+	f = funpack(dat, endian=Endianness.Big, offset=10)
+	out = array.array('H', [0]*5)
+	assert(f.ReadInto(out) is out)
+	assert(out.tolist() == [10,11,12,13,14])
+	assert(f.ReadInto(out).tolist() == [15,16,17,18,19])
+	o = f.Offset
+	for bad in [b'\x00'*4, bytearray(4)]:
+		try:
+			f.ReadInto(bad)
+			assert(False)
+		except TypeError:
+			pass
+		assert(f.Offset == o)
+
+	f = funpack(dat, endian=Endianness.Big, offset=10)
+	it = f.iter_u16(3)
+	assert(f.Offset == 16)
+	assert(list(it) == [10,11,12])
+	f = funpack(struct.pack("<3d", 0.5, 1.5, -2.0), endian='<')
+	assert(list(f.iter_f64(3)) == [0.5, 1.5, -2.0])
+	try:
+		f.iter_s8(1)
+		assert(False)
+	except struct.error:
+		pass
+
+	f = funpack(struct.pack("<hiq", -1, -2, -3), endian=Endianness.Little)
+	assert(f.s16_array(1).tolist() == [-1])
+	assert(f.s32_array(1).tolist() == [-2])
+	assert(f.s64_array(1).tolist() == [-3])
+
+	# ------------- records -------------
+	f = funpack(struct.pack(">" + "HI"*5 + "B", *(list(range(10)) + [99])), endian=Endianness.Big)
+	assert(f.UnpackRecords("HI", 5) == ((0,2,4,6,8), (1,3,5,7,9)))
+	o = f.Offset
+	a, b = f.UnpackRecords("HI", 0)
+	assert(a == () and b == () and f.Offset == o)
+	assert(f.UnpackRecords("3sx", 0) == ((),))
+	assert(f.u8() == 99)
+	f.Offset = 0
+	it = f.IterRecords("HI", 5)
+	assert(f.u8() == 99)
+	assert(list(it) == [(0,1), (2,3), (4,5), (6,7), (8,9)])
+
+	# ------------- s8 -------------
+	f = funpack(struct.pack(">bbb", -1, 127, -128))
+	assert(f.s8() == -1)
+	assert(f.s8() == 127)
+	assert(f.s8() == -128)
+
+	# ------------- u8 past the end -------------
+	f = funpack(b'\x01', endian=Endianness.Big)
+	assert(f.u8() == 1)
+	try:
+		f.u8()
+		assert(False)
+	except struct.error:
+		pass
+	assert(f.Offset == 1)
+
+	# ------------- bytes views -------------
+	f = funpack(bytearray(b'hello world'))
+	v = f.bytes_view(5)
+	assert(v == b'hello' and v.readonly)
+	assert(f.bytes(6) == b' world')
+	try:
+		f.bytes_view(1)
+		assert(False)
+	except struct.error:
+		pass
+	del v
+	b = f.Src
+	f.Src = b'\x01\x02'
+	assert(f.Offset == 11)
+	f.Offset = 0
+	assert(f.u8(2) == (1, 2))
+	b += b'!'
+	assert(b == b'hello world!')
+	try:
+		f.Src = 123
+		assert(False)
+	except TypeError:
+		pass
+	f.Offset = 0
+	assert(f.Src == b'\x01\x02' and f.u8() == 1)
+
+	f.close()
+	try:
+		f.u8()
+		assert(False)
+	except ValueError:
+		pass
+	b = bytearray(2)
+	f.Src = b
+	f.close()
+	b += b'!'
+
+	f = funpack(b'abc', offset=2, arrays=True)
+	for fn in [lambda: f.bytes(-1), lambda: f.string(-1, 'ascii'), lambda: f.u8(-1), lambda: f.u8_array(-1), lambda: f.iter_u8(-1), lambda: f.IterRecords('H', -1)]:
+		try:
+			fn()
+			assert(False)
+		except struct.error:
+			pass
+		assert(f.Offset == 2)
+
+	# ------------- pickling -------------
+	import copy, pickle, weakref
+	f = funpack(dat, endian=Endianness.Big, offset=10, arrays=True)
+	assert(weakref.ref(f)() is f)
+	for g in [pickle.loads(pickle.dumps(f)), copy.deepcopy(f)]:
+		assert(g.Offset == 10 and g.Endian == Endianness.Big and g.Src == dat)
+		assert(g.u16(2).tolist() == [10,11])
+	assert(f.Offset == 10)
+
 	# Try various language encodings to make sure they all work fine
 	for enc in ['ascii', 'utf-7', 'utf-8', 'utf-16', 'utf-32', 'latin_1']:
 		y = z.encode(enc)
@@ -13,6 +13,6 @@ setup(
 	packages = ['funpack'],
 	package_data = {'funpack': ['funpack/__init__.py']},
 	classifiers = [
-		'Programming Language :: Python :: 3.4'
+		'Programming Language :: Python :: 3.8'
 	]
 )